@@ -5,6 +5,7 @@ from flask_login import current_user
 
 from .auth import auth_bp
 from .chat import chat_bp
+from .chat.agent_runtime import warm_up_chat_runtime
 from .chat.routes import weather_demo_api
 from .config import Config
 from .extensions import csrf, db, login_manager, migrate
@@ -23,6 +24,8 @@ def create_app(config_class: type[Config] = Config) -> Flask:
 
     with app.app_context():
         db.create_all()
+        if app.config.get("EAGER_AGENT_INIT", True):
+            warm_up_chat_runtime()
 
     return app
 
@@ -1,8 +1,16 @@
 ﻿from __future__ import annotations
 
+import os
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import TypeVar
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from flask import flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required, login_user, logout_user
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import check_password_hash
 
 from app.extensions import db
 from app.models import User
@@ -10,6 +18,60 @@ from app.models import User
 from . import auth_bp
 from .forms import LoginForm, RegistrationForm
 
+T = TypeVar("T")
+
+ph = PasswordHasher(time_cost=2, memory_cost=46 * 1024, parallelism=1)
+# Verified against when the e-mail is unknown so both login branches cost one hash.
+_DUMMY_HASH = ph.hash("not-a-real-password")
+# Argon2 releases the GIL, so hashes from concurrent requests run in parallel across cores.
+_HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="password-hash")
+
+
+def _offload(fn: Callable[..., T], *args: str) -> T:
+    return _HASH_POOL.submit(fn, *args).result()
+
+
+def _burn_dummy_verify(password: str) -> None:
+    with suppress(VerificationError, InvalidHashError):
+        _offload(ph.verify, _DUMMY_HASH, password)
+
+
+def _verify_password(user: User, password: str) -> bool:
+    """Verify a password and upgrade legacy or outdated hashes on success."""
+
+    if not user.password_hash.startswith("$argon2"):
+        # Legacy werkzeug pbkdf2 hash from before the Argon2 migration.
+        if not _offload(check_password_hash, user.password_hash, password):
+            return False
+        needs_rehash = True
+    else:
+        try:
+            _offload(ph.verify, user.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        needs_rehash = ph.check_needs_rehash(user.password_hash)
+
+    if needs_rehash:
+        user.password_hash = _offload(ph.hash, password)
+        db.session.commit()
+    return True
+
+
+def _flag_taken_fields(form: RegistrationForm) -> bool:
+    """Check e-mail and username uniqueness in one query; return True on collision."""
+
+    email, username = form.email.data, form.username.data.strip()
+    existing = (
+        User.query.with_entities(User.email, User.username)
+        .filter((User.email == email) | (User.username == username))
+        .all()
+    )
+    if any(row.email == email for row in existing):
+        form.email.errors.append("E-Mail ist bereits registriert.")
+    if any(row.username == username for row in existing):
+        form.username.errors.append("Nutzername ist vergeben.")
+    return bool(existing)
+
 
 @auth_bp.route("/register", methods=["GET", "POST"])
 def register():
@@ -17,11 +79,11 @@ def register():
         return redirect(url_for("chat.index"))
 
     form = RegistrationForm()
-    if form.validate_on_submit():
+    if form.validate_on_submit() and not _flag_taken_fields(form):
         user = User(
             username=form.username.data.strip(),
-            email=form.email.data.lower(),
-            password_hash=generate_password_hash(form.password.data),
+            email=form.email.data,
+            password_hash=_offload(ph.hash, form.password.data),
             skill_level=form.skill_level.data,
         )
         db.session.add(user)
@@ -41,7 +103,10 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data.lower()).first()
-        if not user or not check_password_hash(user.password_hash, form.password.data):
+        if user is None:
+            _burn_dummy_verify(form.password.data)
+        ok = user is not None and _verify_password(user, form.password.data)
+        if not ok:
             flash("Login failed. Please check your credentials.", "danger")
         else:
             login_user(user)
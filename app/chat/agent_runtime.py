@@ -1,24 +1,37 @@
 from __future__ import annotations
 
+import itertools
 import json
+import logging
+import secrets
 import sqlite3
 from collections.abc import Iterable
-from datetime import UTC, datetime
+from functools import lru_cache
 from pathlib import Path
+from types import SimpleNamespace
 from typing import Any, ClassVar
-from uuid import uuid4
 
 from flask import current_app
 from langchain.agents import create_agent
 from langchain.agents.structured_output import ToolStrategy
 from langchain.chat_models import init_chat_model
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import AIMessage, AnyMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages import (
+    AIMessage,
+    AnyMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
 from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableConfig
 from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.graph import END, START, StateGraph
 from langgraph.runtime import Runtime
 from langgraph.types import Command, interrupt
+from sqlalchemy import func, inspect
+from sqlalchemy.dialects import postgresql, sqlite
 
 from app.extensions import db
 from app.models import ChatMessage, User
@@ -26,29 +39,39 @@ from app.models import ChatMessage, User
 from .dynamic_prompting import Context, adjust_prompt
 from .schemas import Weather
 from .state import GraphState
-from .tools import ASSISTANT_TOOLS, weather_tool
+from .tools import ASSISTANT_TOOLS, bind_tool_context, reset_tool_context, weather_tool
 
 __all__ = [
     "build_langchain_history",
+    "history_from_entries",
     "run_chat_turn",
     "resume_chat_turn",
     "weather_demo",
 ]
 
 
+_ROLE_TO_CLASS: dict[str, type[AnyMessage]] = {"assistant": AIMessage, "user": HumanMessage}
+
+# Tool-call ids only need to be unique per process: random salt once, then a counter.
+_ID_SALT = secrets.token_hex(4)
+_ID_SEQ = itertools.count()
+_WEATHER_TOOL_NAME = weather_tool.name
+
+
 def build_langchain_history(messages: Iterable[ChatMessage]) -> list[AnyMessage]:
-    """Convert stored chat messages to LangChain message objects."""
-
-    ordered = sorted(messages, key=lambda msg: msg.created_at)
-    history: list[AnyMessage] = []
-    for item in ordered:
-        if item.role == "assistant" and item.approved is not True:
-            continue
-        if item.role == "assistant":
-            history.append(AIMessage(content=item.content))
-        else:
-            history.append(HumanMessage(content=item.content))
-    return history
+    """Convert stored chat messages to LangChain message objects.
+
+    ``messages`` must already be ordered by ``created_at`` and exclude unapproved
+    assistant answers (see ``queries.fetch_thread_history``).
+    """
+
+    return history_from_entries((item.role, item.content) for item in messages)
+
+
+def history_from_entries(entries: Iterable[tuple[str, str]]) -> list[AnyMessage]:
+    """Build new LangChain messages from ``(role, content)`` pairs."""
+
+    return [_ROLE_TO_CLASS.get(role, HumanMessage)(content=content) for role, content in entries]
 
 
 def run_chat_turn(
@@ -59,11 +82,14 @@ def run_chat_turn(
     question: str,
     last_feedback: str | None = None,
 ) -> dict[str, Any]:
-    """Start a new LLM turn and return the interrupt payload."""
+    """Start a new LLM turn and return the interrupt payload.
+
+    ``history`` is handed to the graph as-is; callers must not reuse the list afterwards.
+    """
 
     manager = _get_chat_manager()
     state: GraphState = {
-        "messages": list(history),
+        "messages": history,
         "user_name": user.username,
         "user_id": user.id,
         "skill_level": user.skill_level,
@@ -109,6 +135,9 @@ def weather_demo(city: str) -> Weather:
         context=context,
     )
     structured = result.get("structured_response")
+    if isinstance(structured, Weather):
+        # ToolStrategy already validated the tool output; don't pay for it twice.
+        return structured
     return Weather.model_validate(structured)
 
 
@@ -127,7 +156,9 @@ class LocalSkillModel(BaseChatModel):
         question = self._extract_question(messages)
         role = self._detect_role(messages)
         answer = self._render_answer(question, role)
-        tool_calls = self._planned_tool_calls(question)
+        # Once a tool has answered, reply with text instead of planning the same call again.
+        answered = bool(messages) and isinstance(messages[-1], ToolMessage)
+        tool_calls = [] if answered else self._planned_tool_calls(question)
         ai_message = AIMessage(content=answer, tool_calls=tool_calls)
         return ChatResult(generations=[ChatGeneration(message=ai_message)])
 
@@ -183,8 +214,8 @@ class LocalSkillModel(BaseChatModel):
             city = question.split()[-1].strip('?.!,')
             calls.append(
                 {
-                    'id': f"tool-{uuid4().hex}",
-                    'name': weather_tool.name,
+                    'id': f"tool-{_ID_SALT}-{next(_ID_SEQ):x}",
+                    'name': _WEATHER_TOOL_NAME,
                     'args': {'city': city or 'Berlin'},
                 }
             )
@@ -201,13 +232,22 @@ class WeatherLLM(BaseChatModel):
         run_manager: Any | None = None,
         **kwargs: Any,
     ) -> ChatResult:
+        if messages and isinstance(messages[-1], ToolMessage):
+            # The weather tool answered: hand its payload to the ToolStrategy(Weather) tool.
+            tool_call = {
+                'id': f"weather-{_ID_SALT}-{next(_ID_SEQ):x}",
+                'name': Weather.__name__,
+                'args': json.loads(messages[-1].content),
+            }
+            ai_message = AIMessage(content='', tool_calls=[tool_call])
+            return ChatResult(generations=[ChatGeneration(message=ai_message)])
         city = 'Unknown'
         for message in messages:
             if isinstance(message, HumanMessage):
                 city = str(message.content).split()[-1].strip('?!.,')
         tool_call = {
-            'id': f"weather-{uuid4().hex}",
-            'name': weather_tool.name,
+            'id': f"weather-{_ID_SALT}-{next(_ID_SEQ):x}",
+            'name': _WEATHER_TOOL_NAME,
             'args': {'city': city},
         }
         ai_message = AIMessage(content='Weather data incoming.', tool_calls=[tool_call])
@@ -230,54 +270,52 @@ class ChatGraphManager:
         self._checkpointer = None
         self._conn = None
         self._weather_agent = None
+        self._cfg: SimpleNamespace | None = None
+        self._pending_upsert: Any = _UNRESOLVED
 
     def run(self, *, state: GraphState, context: Context, thread_id: str) -> dict[str, Any]:
         graph = self._ensure_graph()
         config = {"configurable": {"thread_id": thread_id}}
-        stream = graph.stream(state, config=config, context=context)
-        last: dict[str, Any] | None = None
-        try:
-            for event in stream:
-                if "__interrupt__" in event:
-                    interrupt_obj = event["__interrupt__"][0]
-                    return {"status": "interrupt", "payload": interrupt_obj.value}
-                last = event
-        finally:
-            stream.close()
-        return {"status": "complete", "payload": last}
+        return self._drain(graph.stream(state, config=config, context=context))
 
     def resume(
         self, *, thread_id: str, payload: dict[str, Any], context: Context
     ) -> dict[str, Any]:
         graph = self._ensure_graph()
         config = {"configurable": {"thread_id": thread_id}}
-        stream = graph.stream(Command(resume=payload), config=config, context=context)
+        return self._drain(graph.stream(Command(resume=payload), config=config, context=context))
+
+    @staticmethod
+    def _drain(stream) -> dict[str, Any]:
         last: dict[str, Any] | None = None
         try:
             for event in stream:
                 if "__interrupt__" in event:
                     interrupt_obj = event["__interrupt__"][0]
                     return {"status": "interrupt", "payload": interrupt_obj.value}
-                last = event
+                last = ChatGraphManager._summarize_event(event)
         finally:
             stream.close()
         return {"status": "complete", "payload": last}
 
+    @staticmethod
+    def _summarize_event(event: dict[str, Any]) -> dict[str, Any]:
+        """Keep the node name and scalar fields; drop message lists so they can be freed."""
+
+        summary: dict[str, Any] = {}
+        for node, update in event.items():
+            summary["node"] = node
+            if isinstance(update, dict):
+                summary.update((key, value) for key, value in update.items() if key != "messages")
+        return summary
+
     def _ensure_graph(self):
         if self._graph is not None:
             return self._graph
-        agent = self._ensure_agent()
-        builder = StateGraph(state_schema=GraphState, context_schema=Context)
-        builder.add_node("llm_turn", lambda state, runtime: self._llm_turn(agent, state, runtime))
-        builder.add_node("approval_gate", self._approval_gate)
-        builder.add_edge(START, "llm_turn")
-        builder.add_edge("llm_turn", "approval_gate")
-        builder.add_conditional_edges(
-            "approval_gate",
-            lambda state: "retry" if state.get("needs_retry") else "approved",
-            {"retry": "llm_turn", "approved": END},
-        )
-        self._graph = builder.compile(checkpointer=self._ensure_checkpointer())
+        # The agent (and its chat model) is built by the first llm_turn, not here.
+        graph = _graph_builder().compile(checkpointer=self._ensure_checkpointer())
+        # The shared node functions find this manager through the run config.
+        self._graph = graph.with_config(configurable={_MANAGER_CONFIG_KEY: self})
         return self._graph
 
     def _ensure_agent(self):
@@ -293,18 +331,39 @@ class ChatGraphManager:
         )
         return self._agent
 
+    def _config(self) -> SimpleNamespace:
+        if self._cfg is None:
+            self._cfg = self._load_cfg()
+        return self._cfg
+
+    @staticmethod
+    def _load_cfg() -> SimpleNamespace:
+        """Snapshot the app config values the runtime needs; they never change per process."""
+
+        config = current_app.config
+        return SimpleNamespace(
+            use_fake_llm=bool(config.get("USE_FAKE_LLM")),
+            testing=bool(config.get("TESTING")),
+            default_model=config.get("LANGCHAIN_DEFAULT_MODEL"),
+            graph_db_path=config.get("GRAPH_DB_PATH", "graph_state.db"),
+        )
+
     def _build_model(self) -> BaseChatModel:
-        if current_app.config.get("USE_FAKE_LLM") or current_app.config.get("TESTING"):
+        cfg = self._config()
+        if cfg.use_fake_llm or cfg.testing:
             return LocalSkillModel()
-        model_name = current_app.config.get("LANGCHAIN_DEFAULT_MODEL")
-        return init_chat_model(model=model_name)
+        return init_chat_model(model=cfg.default_model)
 
     def _ensure_checkpointer(self) -> SqliteSaver:
         if self._checkpointer is not None:
             return self._checkpointer
-        path = Path(current_app.config.get("GRAPH_DB_PATH", "graph_state.db"))
+        path = Path(self._config().graph_db_path)
         path.parent.mkdir(parents=True, exist_ok=True)
         conn = sqlite3.connect(path, check_same_thread=False)
+        # LangGraph writes a checkpoint per node; WAL + synchronous=NORMAL avoids an fsync
+        # per commit. Losing the last checkpoint on power loss only replays one turn.
+        for pragma in _CHECKPOINT_PRAGMAS:
+            conn.execute(pragma)
         self._conn = conn
         self._checkpointer = SqliteSaver(conn)
         return self._checkpointer
@@ -322,15 +381,23 @@ class ChatGraphManager:
         context = runtime.context or Context()
         context.last_feedback = state.get("last_feedback")
         self._log_prompt_messages(state)
-        response = agent.invoke(
-            state,
-            config={
-                "configurable": {"thread_id": state["thread_id"]},
-                "context": context,
-            },
-        )
+        token = bind_tool_context(context)
+        try:
+            response = agent.invoke(
+                state,
+                config={
+                    "configurable": {"thread_id": state["thread_id"]},
+                    "context": context,
+                },
+            )
+        finally:
+            reset_tool_context(token)
         messages = response["messages"]
-        last_ai = next((msg for msg in reversed(messages) if isinstance(msg, AIMessage)), None)
+        last_ai = None
+        for idx in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[idx], AIMessage):
+                last_ai = messages[idx]
+                break
         answer = self._message_as_text(last_ai) if last_ai else ""
         self._log_model_answer(state["thread_id"], answer)
         return {
@@ -344,7 +411,12 @@ class ChatGraphManager:
         answer = state.get("last_answer") or ""
         pending_id = state.get("pending_message_id")
         if not pending_id:
-            pending_id = self._ensure_pending_message_row(state, answer)
+            pending_id, changed = self._ensure_pending_message_row(state, answer)
+            if changed:
+                # The reviewer must see the pending row before the graph pauses. On resume
+                # the row is unchanged, so all writes land in the single commit below.
+                self._commit()
+            state["pending_message_id"] = pending_id
         else:
             self._cleanup_extra_pending(state, pending_id)
         payload = {
@@ -362,17 +434,26 @@ class ChatGraphManager:
         if chat_message:
             chat_message.approved = approved
             chat_message.rejection_reason = None if approved else feedback
-            db.session.commit()
+        self._commit()
         state["last_feedback"] = None
         if approved:
             return {"pending_message_id": None, "needs_retry": False}
-        for idx in range(len(state["messages"]) - 1, -1, -1):
-            if isinstance(state["messages"][idx], AIMessage):
-                state["messages"].pop(idx)
+        messages = state["messages"]
+        for idx in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[idx], AIMessage):
+                messages.pop(idx)
                 break
         state["last_feedback"] = feedback
         return {"pending_message_id": None, "needs_retry": True, "last_feedback": feedback}
 
+    @staticmethod
+    def _commit() -> None:
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
     @staticmethod
     def _message_as_text(message: AIMessage | None) -> str:
         if not message:
@@ -382,17 +463,17 @@ class ChatGraphManager:
     @staticmethod
     def _plain_text_content(message: AnyMessage) -> str:
         content = getattr(message, "content", "")
+        if isinstance(content, str):
+            return content
         if isinstance(content, list):
-            texts = []
-            for part in content:
-                if isinstance(part, dict) and "text" in part:
-                    texts.append(str(part["text"]))
-            return "\n".join(texts)
+            return "\n".join(
+                str(part["text"]) for part in content if isinstance(part, dict) and "text" in part
+            )
         return str(content)
 
     def _log_prompt_messages(self, state: GraphState) -> None:
         logger = getattr(current_app, "logger", None)
-        if not logger:
+        if not logger or not logger.isEnabledFor(logging.INFO):
             return
         serialized = [
             {
@@ -409,50 +490,107 @@ class ChatGraphManager:
 
     def _log_model_answer(self, thread_id: str, answer: str) -> None:
         logger = getattr(current_app, "logger", None)
-        if not logger:
+        if not logger or not logger.isEnabledFor(logging.INFO):
             return
         preview = answer if len(answer) < 500 else f"{answer[:500]}..."
         logger.info("Thread %s <- model answer: %s", thread_id, preview)
 
-    def _ensure_pending_message_row(self, state: GraphState, answer: str) -> int:
-        """Ensure there is exactly one pending ChatMessage per thread."""
+    def _ensure_pending_message_row(self, state: GraphState, answer: str) -> tuple[int, bool]:
+        """Upsert the single pending ChatMessage per thread; the caller commits.
 
-        latest_pending = (
-            ChatMessage.query.filter_by(
-                user_id=state["user_id"],
-                thread_id=state["thread_id"],
-                role="assistant",
-            )
-            .order_by(ChatMessage.created_at.desc())
-            .first()
-        )
-        if latest_pending and latest_pending.approved is None:
-            updated = False
-            if latest_pending.content != answer:
-                latest_pending.content = answer
-                updated = True
-            if latest_pending.rejection_reason:
-                latest_pending.rejection_reason = None
-                updated = True
-            if updated:
-                latest_pending.created_at = datetime.now(UTC)
-                db.session.commit()
-            state["pending_message_id"] = latest_pending.id
-            return latest_pending.id
-
-        new_message = ChatMessage(
+        Returns the row id and whether anything was written. The partial unique index
+        ``ix_chatmessage_pending_one`` guarantees at most one pending answer per thread.
+        """
+
+        insert = self._pending_upsert_insert()
+        if insert is None:
+            return self._select_or_insert_pending_row(state, answer)
+        stmt = insert(ChatMessage).values(
             user_id=state["user_id"],
             role="assistant",
             content=answer,
             thread_id=state["thread_id"],
             approved=None,
         )
-        db.session.add(new_message)
-        db.session.commit()
-        state["pending_message_id"] = new_message.id
-        return new_message.id
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "thread_id", "role"],
+            index_where=ChatMessage.approved.is_(None),
+            set_={
+                "content": stmt.excluded.content,
+                "rejection_reason": None,
+                "created_at": func.now(),
+            },
+            where=(ChatMessage.content != stmt.excluded.content)
+            | ChatMessage.rejection_reason.isnot(None),
+        ).returning(ChatMessage.id)
+        pending_id = db.session.execute(stmt).scalar()
+        if pending_id is not None:
+            return pending_id, True
+
+        # Conflict without changes (graph replay on resume): nothing was written.
+        return self._pending_message_id(state), False
+
+    def _pending_upsert_insert(self):
+        """Return the dialect's ``insert`` for the upsert, or ``None`` if it can't be used.
+
+        The upsert needs ``ON CONFLICT`` support and the partial unique index as its
+        conflict target; ``db.create_all()`` does not add the index to existing tables.
+        """
+
+        if self._pending_upsert is _UNRESOLVED:
+            bind = db.session.get_bind()
+            insert = _UPSERT_INSERTS.get(bind.dialect.name)
+            if insert is not None:
+                indexes = inspect(bind).get_indexes(ChatMessage.__tablename__)
+                if not any(index["name"] == _PENDING_INDEX for index in indexes):
+                    current_app.logger.warning(
+                        "Index %s is missing; pending answers use select-then-insert.",
+                        _PENDING_INDEX,
+                    )
+                    insert = None
+            self._pending_upsert = insert
+        return self._pending_upsert
+
+    def _select_or_insert_pending_row(
+        self, state: GraphState, answer: str
+    ) -> tuple[int, bool]:
+        """Fallback when the upsert can't be used; the caller commits."""
+
+        pending = db.session.get(ChatMessage, self._pending_message_id(state) or 0)
+        if pending is None:
+            pending = ChatMessage(
+                user_id=state["user_id"],
+                role="assistant",
+                content=answer,
+                thread_id=state["thread_id"],
+                approved=None,
+            )
+            db.session.add(pending)
+            db.session.flush()
+            return pending.id, True
+        if pending.content == answer and not pending.rejection_reason:
+            return pending.id, False
+        pending.content = answer
+        pending.rejection_reason = None
+        pending.created_at = func.now()
+        return pending.id, True
+
+    @staticmethod
+    def _pending_message_id(state: GraphState) -> int | None:
+        return (
+            db.session.query(ChatMessage.id)
+            .filter_by(
+                user_id=state["user_id"],
+                thread_id=state["thread_id"],
+                role="assistant",
+                approved=None,
+            )
+            .scalar()
+        )
+
+    def _cleanup_extra_pending(self, state: GraphState, active_id: int) -> list[ChatMessage]:
+        """Reject stale pending answers besides ``active_id``; the caller commits."""
 
-    def _cleanup_extra_pending(self, state: GraphState, active_id: int) -> None:
         extras = (
             ChatMessage.query.filter(
                 ChatMessage.user_id == state["user_id"],
@@ -463,11 +601,43 @@ class ChatGraphManager:
             )
             .all()
         )
-        if not extras:
-            return
         for extra in extras:
             extra.approved = False
-        db.session.commit()
+        return extras
+
+def _llm_turn_node(
+    state: GraphState, runtime: Runtime[Context], config: RunnableConfig
+) -> dict[str, Any]:
+    manager = config["configurable"][_MANAGER_CONFIG_KEY]
+    return manager._llm_turn(manager._ensure_agent(), state, runtime)
+
+
+def _approval_gate_node(
+    state: GraphState, runtime: Runtime[Context], config: RunnableConfig
+) -> dict[str, Any]:
+    return config["configurable"][_MANAGER_CONFIG_KEY]._approval_gate(state, runtime)
+
+
+@lru_cache(maxsize=1)
+def _graph_builder() -> StateGraph:
+    """Node/edge wiring shared by every manager; only the checkpointer differs per compile.
+
+    Nodes dispatch to the manager that compiled the graph (bound under
+    ``_MANAGER_CONFIG_KEY``), so the builder survives ``reset_chat_runtime``.
+    """
+
+    builder = StateGraph(state_schema=GraphState, context_schema=Context)
+    builder.add_node("llm_turn", _llm_turn_node)
+    builder.add_node("approval_gate", _approval_gate_node)
+    builder.add_edge(START, "llm_turn")
+    builder.add_edge("llm_turn", "approval_gate")
+    builder.add_conditional_edges(
+        "approval_gate",
+        lambda state: "retry" if state.get("needs_retry") else "approved",
+        {"retry": "llm_turn", "approved": END},
+    )
+    return builder
+
 
 def _get_chat_manager() -> ChatGraphManager:
     global _CHAT_MANAGER
@@ -477,6 +647,18 @@ def _get_chat_manager() -> ChatGraphManager:
 
 
 _CHAT_MANAGER: ChatGraphManager | None = None
+_MANAGER_CONFIG_KEY = "chat_manager"
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+_PENDING_INDEX = "ix_chatmessage_pending_one"
+_UNRESOLVED = object()
+_CHECKPOINT_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+)
 _WEATHER_AGENT = None
 
 
@@ -494,6 +676,16 @@ def _get_weather_agent():
     return _WEATHER_AGENT
 
 
+def warm_up_chat_runtime() -> None:
+    """Open the checkpointer and compile the chat graph at startup.
+
+    The chat model stays lazy, so CLI commands and the auth pages start without LLM
+    credentials.
+    """
+
+    _get_chat_manager()._ensure_graph()
+
+
 def reset_chat_runtime() -> None:
     """Helper used in tests to close the sqlite checkpointer connection."""
 
@@ -1,11 +1,12 @@
 ﻿from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 
 from langchain.agents.middleware import ModelRequest, dynamic_prompt
 
 
-@dataclass
+@dataclass(slots=True)
 class Context:
     user_role: str = "beginner"
     user_name: str = ""
@@ -16,6 +17,11 @@ class Context:
 
 
 def _prompt_for_skill(role: str, user_name: str, feedback: str | None = None) -> str:
+    return _prompt_for_skill_cached(role, user_name, feedback)
+
+
+@lru_cache(maxsize=1024)
+def _prompt_for_skill_cached(role: str, user_name: str, feedback: str | None) -> str:
     base = "You are a Python explainer bot for {user}.".format(user=user_name or "the user")
     if role == "expert":
         style = (
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+
+HistoryKey = tuple[int, str]
+# ``(role, content)`` of one stored ChatMessage.
+HistoryEntry = tuple[str, str]
+
+
+class HistoryCache:
+    """Process-local LRU of a thread's history per ``(user_id, thread_id)``.
+
+    Each entry remembers the highest ``ChatMessage.id`` it covers, so a turn only has to
+    load rows inserted since then. History is kept as immutable ``(role, content)``
+    pairs: the graph assigns ids to the LangChain messages it receives, so every turn
+    must build fresh message objects. Entries must be invalidated when a thread's rows
+    are deleted.
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self._maxsize = maxsize
+        self._entries: OrderedDict[HistoryKey, tuple[int, tuple[HistoryEntry, ...]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: HistoryKey) -> tuple[int, tuple[HistoryEntry, ...]]:
+        """Return ``(last_message_id, entries)``; ``(0, ())`` on a miss."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0, ()
+            self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key: HistoryKey, last_id: int, entries: tuple[HistoryEntry, ...]) -> None:
+        with self._lock:
+            self._entries[key] = (last_id, entries)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: HistoryKey) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+history_cache = HistoryCache()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from sqlalchemy import bindparam, exists, lambda_stmt, select
+
+from app.extensions import db
+from app.models import ChatMessage, ToolCallLog
+
+# Cached statements: SQLAlchemy compiles each once and only rebinds :uid / :tid per call.
+_thread_messages = lambda_stmt(
+    lambda: (
+        select(
+            ChatMessage,
+            exists()
+            .where(
+                ChatMessage.user_id == bindparam("uid"),
+                ChatMessage.thread_id == bindparam("tid"),
+                ChatMessage.role == "assistant",
+                ChatMessage.approved.is_(None),
+            )
+            .label("awaiting"),
+        )
+        .where(ChatMessage.user_id == bindparam("uid"), ChatMessage.thread_id == bindparam("tid"))
+        .order_by(ChatMessage.created_at, ChatMessage.id)
+    )
+)
+_pending_tools = lambda_stmt(
+    lambda: (
+        select(ToolCallLog)
+        .where(
+            ToolCallLog.user_id == bindparam("uid"),
+            ToolCallLog.thread_id == bindparam("tid"),
+            ToolCallLog.approved.is_(None),
+        )
+        .order_by(ToolCallLog.created_at, ToolCallLog.id)
+    )
+)
+_thread_history = lambda_stmt(
+    lambda: (
+        select(ChatMessage)
+        .where(
+            ChatMessage.user_id == bindparam("uid"),
+            ChatMessage.thread_id == bindparam("tid"),
+            ChatMessage.id > bindparam("after"),
+            ~((ChatMessage.role == "assistant") & ChatMessage.approved.isnot(True)),
+        )
+        .order_by(ChatMessage.created_at, ChatMessage.id)
+    )
+)
+
+
+def batch_fetch_thread_view(
+    user_id: int, thread_id: str
+) -> tuple[list[ChatMessage], list[ToolCallLog], bool]:
+    """Load everything the chat page needs for one thread.
+
+    The "answer awaiting review" flag rides along as an ``EXISTS`` column on the message
+    query, so no Python scan over the history is needed.
+    """
+
+    params = {"uid": user_id, "tid": thread_id}
+    rows = db.session.execute(_thread_messages, params).all()
+    messages = [row.ChatMessage for row in rows]
+    awaiting_message = bool(rows[0].awaiting) if rows else False
+    pending_tools = db.session.execute(_pending_tools, params).scalars().all()
+    return messages, pending_tools, awaiting_message
+
+
+def fetch_thread_history(user_id: int, thread_id: str, after_id: int = 0) -> list[ChatMessage]:
+    """Ordered thread messages without unapproved assistant answers, filtered in SQL.
+
+    ``after_id`` restricts the result to rows newer than an already converted prefix.
+    """
+
+    params = {"uid": user_id, "tid": thread_id, "after": after_id}
+    return db.session.execute(_thread_history, params).scalars().all()
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import threading
+import time
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets kept in process memory.
+
+    Each key may burst up to ``capacity`` requests, then earns one request back every
+    ``1 / refill_rate`` seconds. State is per process; multi-worker deployments need a
+    shared store (e.g. Redis) running the same algorithm.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: dict[object, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: object, *, capacity: float, refill_rate: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last_refill = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last_refill) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return allowed
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+post_limiter = TokenBucketLimiter()
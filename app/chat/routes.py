@@ -1,13 +1,13 @@
 ﻿from __future__ import annotations
 
-import time
+from typing import Any
 from uuid import uuid4
 
 from flask import (
     abort,
     current_app,
     flash,
-    jsonify,
+    g,
     redirect,
     render_template,
     request,
@@ -15,63 +15,84 @@ from flask import (
     url_for,
 )
 from flask_login import current_user, login_required
+from langchain_core.messages import AnyMessage
+from sqlalchemy import delete
 
 from app.extensions import db
 from app.models import ChatMessage, ToolCallLog
 
 from . import chat_bp
 from .agent_runtime import (
-    build_langchain_history,
+    history_from_entries,
     reset_thread_state,
     resume_chat_turn,
     run_chat_turn,
     weather_demo,
 )
+from .history_cache import history_cache
+from .queries import batch_fetch_thread_view, fetch_thread_history
+from .ratelimit import post_limiter
+from .tasks import dispatch_turn, is_turn_running, release, try_claim
 
 
 def _thread_id() -> str:
+    thread = g.get("thread_id")
+    if thread:
+        return thread
     thread = session.get("thread_id")
     if not thread:
         thread = uuid4().hex
         session["thread_id"] = thread
+    g.thread_id = thread
     return thread
 
 
 def _enforce_rate_limit() -> None:
-    last_ts = session.get("last_post_ts", 0.0)
-    delta = time.monotonic() - float(last_ts)
     min_interval = current_app.config.get("POST_MIN_INTERVAL_SECONDS", 2)
-    if delta < min_interval:
+    allowed = post_limiter.consume(
+        current_user.id,
+        capacity=current_app.config.get("POST_BURST_SIZE", 5),
+        refill_rate=1 / min_interval if min_interval > 0 else float("inf"),
+    )
+    if not allowed:
         abort(429, description="Too many requests. Please wait a moment.")
-    session["last_post_ts"] = time.monotonic()
+
+
+def _resume_turn(payload: dict[str, Any]) -> bool:
+    """Resume the thread's graph unless a background turn for it is still running."""
+
+    thread_id = _thread_id()
+    if not try_claim(thread_id):
+        flash("The assistant is still working on this thread.", "warning")
+        return False
+    dispatch_turn(resume_chat_turn, user=current_user, thread_id=thread_id, payload=payload)
+    return True
 
 
 def _has_pending_message(thread_id: str) -> bool:
-    return (
-        ChatMessage.query.filter_by(
-            user_id=current_user.id, thread_id=thread_id, role="assistant", approved=None
-        ).first()
-        is not None
+    pending = db.session.query(ChatMessage.id).filter_by(
+        user_id=current_user.id, thread_id=thread_id, role="assistant", approved=None
     )
+    return db.session.query(pending.exists()).scalar()
 
 
 @chat_bp.route("/", methods=["GET"])
 @login_required
 def index():
-    thread_id = _thread_id()
-    messages = (
-        ChatMessage.query.filter_by(user_id=current_user.id, thread_id=thread_id)
-        .order_by(ChatMessage.created_at)
-        .all()
-    )
-    pending_tools = (
-        ToolCallLog.query.filter_by(user_id=current_user.id, approved=None, thread_id=thread_id)
-        .order_by(ToolCallLog.created_at)
-        .all()
-    )
-    awaiting_message = any(msg.role == "assistant" and msg.approved is None for msg in messages)
+    # Read-only: the thread id is minted on the first POST, so viewing the page never
+    # forces a session cookie write.
+    thread_id = session.get("thread_id")
+    if thread_id:
+        messages, pending_tools, awaiting_message = batch_fetch_thread_view(
+            current_user.id, thread_id
+        )
+    else:
+        messages, pending_tools, awaiting_message = [], [], False
+    turn_running = is_turn_running(thread_id)
     status_message = None
-    if awaiting_message:
+    if turn_running:
+        status_message = "Generating a response..."
+    elif awaiting_message:
         status_message = "Waiting for approval of the last answer."
     elif pending_tools:
         status_message = "A tool call requires approval."
@@ -81,6 +102,7 @@ def index():
         pending_tools=pending_tools,
         awaiting_message=awaiting_message,
         status_message=status_message,
+        turn_running=turn_running,
         thread_id=thread_id,
     )
 
@@ -90,15 +112,41 @@ def index():
 def send_message():
     _enforce_rate_limit()
     thread_id = _thread_id()
-    if _has_pending_message(thread_id):
-        flash("Please review the current assistant response first.", "warning")
-        return redirect(url_for("chat.index"))
-
     content = (request.form.get("message") or "").strip()
     if not content:
         flash("Your question cannot be empty.", "warning")
         return redirect(url_for("chat.index"))
 
+    # Claim the thread before storing anything, so a refused post leaves no user row.
+    if not try_claim(thread_id):
+        flash("The assistant is still working on this thread.", "warning")
+        return redirect(url_for("chat.index"))
+    handed_off = False
+    try:
+        if _has_pending_message(thread_id):
+            flash("Please review the current assistant response first.", "warning")
+            return redirect(url_for("chat.index"))
+        history = _record_user_message(thread_id, content)
+        last_feedback = session.pop("last_feedback", None)
+        handed_off = True
+        dispatch_turn(
+            run_chat_turn,
+            user=current_user,
+            thread_id=thread_id,
+            history=history,
+            question=content,
+            last_feedback=last_feedback,
+        )
+    finally:
+        if not handed_off:
+            release(thread_id)
+    flash("Response is being prepared. Use Approve/Reject when it arrives.", "info")
+    return redirect(url_for("chat.index"))
+
+
+def _record_user_message(thread_id: str, content: str) -> list[AnyMessage]:
+    """Store the user's message and return the full history for the next turn."""
+
     user_message = ChatMessage(
         user_id=current_user.id,
         role="user",
@@ -106,25 +154,19 @@ def send_message():
         thread_id=thread_id,
         approved=True,
     )
+    # Only rows newer than the cached history are loaded. Reading them before the commit
+    # also avoids reloading rows that the commit would expire.
+    cache_key = (current_user.id, thread_id)
+    last_id, entries = history_cache.get(cache_key)
+    new_rows = fetch_thread_history(current_user.id, thread_id, after_id=last_id)
+    new_rows.append(user_message)
+    entries += tuple((row.role, row.content) for row in new_rows)
     db.session.add(user_message)
+    db.session.flush()
+    user_message_id = user_message.id
     db.session.commit()
-
-    messages = (
-        ChatMessage.query.filter_by(user_id=current_user.id, thread_id=thread_id)
-        .order_by(ChatMessage.created_at)
-        .all()
-    )
-    history = build_langchain_history(messages)
-    last_feedback = session.pop("last_feedback", None)
-    run_chat_turn(
-        user=current_user,
-        thread_id=thread_id,
-        history=history,
-        question=content,
-        last_feedback=last_feedback,
-    )
-    flash("Response is being prepared. Use Approve/Reject when it arrives.", "info")
-    return redirect(url_for("chat.index"))
+    history_cache.store(cache_key, user_message_id, entries)
+    return history_from_entries(entries)
 
 
 @chat_bp.route("/reset", methods=["POST"])
@@ -132,17 +174,16 @@ def send_message():
 def reset_chat():
     thread_id = session.get("thread_id")
     if thread_id:
-        (
-            ChatMessage.query.filter_by(user_id=current_user.id, thread_id=thread_id)
-            .delete(synchronize_session=False)
-        )
-        (
-            ToolCallLog.query.filter_by(user_id=current_user.id, thread_id=thread_id)
-            .delete(synchronize_session=False)
-        )
+        user_id = current_user.id
+        for model in (ChatMessage, ToolCallLog):
+            db.session.execute(
+                delete(model).where(model.user_id == user_id, model.thread_id == thread_id),
+                execution_options={"synchronize_session": False},
+            )
         db.session.commit()
+        history_cache.invalidate((current_user.id, thread_id))
         reset_thread_state(thread_id)
-    session["thread_id"] = uuid4().hex
+    session.pop("thread_id", None)
     flash("Chat has been reset.", "info")
     return redirect(url_for("chat.index"))
 
@@ -154,8 +195,8 @@ def approve_message():
     if not message_id:
         abort(400, description="message_id missing")
     payload = {"kind": "message_review", "approved": True, "message_id": int(message_id)}
-    resume_chat_turn(user=current_user, thread_id=_thread_id(), payload=payload)
-    flash("Answer approved.", "success")
+    if _resume_turn(payload):
+        flash("Answer approved.", "success")
     return redirect(url_for("chat.index"))
 
 
@@ -166,15 +207,15 @@ def reject_message():
     if not message_id:
         abort(400, description="message_id missing")
     feedback = (request.form.get("feedback") or "").strip()
-    session["last_feedback"] = feedback or None
     payload = {
         "kind": "message_review",
         "approved": False,
         "message_id": int(message_id),
         "feedback": feedback,
     }
-    resume_chat_turn(user=current_user, thread_id=_thread_id(), payload=payload)
-    flash("Answer will be regenerated using your feedback.", "warning")
+    if _resume_turn(payload):
+        session["last_feedback"] = feedback or None
+        flash("Answer will be regenerated using your feedback.", "warning")
     return redirect(url_for("chat.index"))
 
 
@@ -185,8 +226,8 @@ def approve_tool():
     if not log_id:
         abort(400, description="log_id missing")
     payload = {"kind": "tool_review", "approved": True, "log_id": int(log_id)}
-    resume_chat_turn(user=current_user, thread_id=_thread_id(), payload=payload)
-    flash("Tool call approved.", "success")
+    if _resume_turn(payload):
+        flash("Tool call approved.", "success")
     return redirect(url_for("chat.index"))
 
 
@@ -203,8 +244,8 @@ def reject_tool():
         "log_id": int(log_id),
         "feedback": feedback,
     }
-    resume_chat_turn(user=current_user, thread_id=_thread_id(), payload=payload)
-    flash("Tool call rejected.", "info")
+    if _resume_turn(payload):
+        flash("Tool call rejected.", "info")
     return redirect(url_for("chat.index"))
 
 
@@ -212,4 +253,4 @@ def reject_tool():
 def weather_demo_api():
     city = request.args.get("city", "Berlin")
     weather = weather_demo(city)
-    return jsonify(weather.model_dump())
+    return current_app.response_class(weather.model_dump_json(), mimetype="application/json")
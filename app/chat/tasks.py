@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from flask import Flask, current_app
+
+from app.extensions import db
+from app.models import User
+
+_TURN_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-turn")
+_RUNNING_THREADS: set[str] = set()
+_RUNNING_LOCK = threading.Lock()
+
+
+def try_claim(thread_id: str) -> bool:
+    """Mark the thread as busy; ``False`` if a turn for it is already claimed."""
+
+    with _RUNNING_LOCK:
+        if thread_id in _RUNNING_THREADS:
+            return False
+        _RUNNING_THREADS.add(thread_id)
+        return True
+
+
+def release(thread_id: str) -> None:
+    with _RUNNING_LOCK:
+        _RUNNING_THREADS.discard(thread_id)
+
+
+def is_turn_running(thread_id: str) -> bool:
+    with _RUNNING_LOCK:
+        return thread_id in _RUNNING_THREADS
+
+
+def dispatch_turn(turn: Callable[..., Any], *, user: User, thread_id: str, **kwargs: Any) -> None:
+    """Run a chat turn for a thread claimed with ``try_claim`` and release it afterwards.
+
+    With ``CHAT_BACKGROUND_TURNS`` the turn runs on the turn pool, freeing the request
+    worker immediately; the chat page refreshes itself while ``is_turn_running``
+    reports the thread as busy.
+    """
+
+    if not current_app.config.get("CHAT_BACKGROUND_TURNS"):
+        try:
+            turn(user=user, thread_id=thread_id, **kwargs)
+        finally:
+            release(thread_id)
+        return
+    app = current_app._get_current_object()
+    try:
+        _TURN_POOL.submit(_run_in_background, app, turn, user.id, thread_id, kwargs)
+    except Exception:
+        release(thread_id)
+        raise
+
+
+def _run_in_background(
+    app: Flask,
+    turn: Callable[..., Any],
+    user_id: int,
+    thread_id: str,
+    kwargs: dict[str, Any],
+) -> None:
+    try:
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            if user is not None:
+                turn(user=user, thread_id=thread_id, **kwargs)
+    except Exception:  # pragma: no cover - logged, the page stops refreshing
+        app.logger.exception("Background chat turn failed for thread %s", thread_id)
+    finally:
+        release(thread_id)
@@ -1,9 +1,11 @@
 ﻿from __future__ import annotations
 
-import json
-from datetime import datetime
+from contextvars import ContextVar, Token
+from datetime import UTC, datetime
+from functools import lru_cache
 from random import Random
 
+import numpy as np
 from langchain_core.tools import tool
 from langgraph.runtime import get_runtime
 
@@ -12,11 +14,30 @@ from app.models import ToolCallLog
 
 from .dynamic_prompting import Context
 
+_tool_context: ContextVar[Context] = ContextVar("tool_context")
+
+
+def bind_tool_context(context: Context) -> Token[Context]:
+    """Expose the turn's context to tools; reset the returned token when the turn ends."""
+
+    return _tool_context.set(context)
+
+
+def reset_tool_context(token: Token[Context]) -> None:
+    _tool_context.reset(token)
+
 
 def _get_runtime_context() -> Context:
-    runtime = get_runtime(Context)
-    context = runtime.context or Context()
-    runtime.context = context
+    try:
+        return _tool_context.get()
+    except LookupError:
+        pass
+    # Outside a bound turn (e.g. the weather demo agent) fall back to the graph runtime.
+    # Runtime is frozen, so a missing context is bound to the ContextVar instead.
+    context = get_runtime(Context).context
+    if context is None:
+        context = Context()
+        _tool_context.set(context)
     return context
 
 
@@ -30,17 +51,18 @@ def _start_tool_log(tool_name: str, args: dict) -> ToolCallLog:
     log = ToolCallLog(
         user_id=context.user_id or 0,
         tool_name=tool_name,
-        args_json=json.dumps(args, ensure_ascii=False),
+        args_json=args,
         thread_id=context.thread_id,
     )
     db.session.add(log)
-    db.session.commit()
+    # Flush for the id only; _finish_tool_log commits insert and result together.
+    db.session.flush()
     context.current_tool_log_id = log.id
     return log
 
 
 def _finish_tool_log(log: ToolCallLog, result: dict, approved: bool | None) -> None:
-    log.result_json = json.dumps(result, ensure_ascii=False)
+    log.result_json = result
     log.approved = approved
     db.session.commit()
     context = _get_runtime_context()
@@ -52,7 +74,7 @@ def read_email(subject: str) -> str:
     """Provide a short summary of an email by subject."""
 
     log = _start_tool_log("read_email", {"subject": subject})
-    summary = f"Summary for '{subject}': routine update ({datetime.utcnow().date()})."
+    summary = f"Summary for '{subject}': routine update ({datetime.now(UTC).date()})."
     _finish_tool_log(log, {"summary": summary}, approved=True)
     return summary
 
@@ -67,6 +89,16 @@ def search_web(query: str) -> str:
     return result
 
 
+# Below this size NumPy's call overhead outweighs its vectorized reduction.
+_NUMPY_MIN_SIZE = 32
+
+
+def _mean(numbers: list[float]) -> float:
+    if len(numbers) < _NUMPY_MIN_SIZE:
+        return sum(numbers) / len(numbers)
+    return float(np.asarray(numbers, dtype=np.float64).mean())
+
+
 @tool
 def analyze_data(numbers: list[float]) -> str:
     """Compute simple statistics for a list of numbers."""
@@ -75,23 +107,31 @@ def analyze_data(numbers: list[float]) -> str:
     if not numbers:
         summary = "No data received."
     else:
-        avg = sum(numbers) / len(numbers)
+        avg = _mean(numbers)
         summary = f"Average: {avg:.2f} calculated from {len(numbers)} values."
     _finish_tool_log(log, {"summary": summary}, approved=True)
     return summary
 
 
+@lru_cache(maxsize=1024)
+def _compute_weather(city_key: str) -> tuple[float, str]:
+    """Deterministic dummy weather: a pure function of the lower-cased city name."""
+
+    rnd = Random(city_key)
+    temperature = rnd.uniform(-2, 30)
+    condition = rnd.choice(["sunny", "cloudy", "rain", "windy"])
+    return round(temperature, 1), condition
+
+
 @tool
 def weather_tool(city: str) -> dict:
     """Return dummy weather data for a city."""
 
     log = _start_tool_log("weather_tool", {"city": city})
-    rnd = Random(city.lower())
-    temperature = rnd.uniform(-2, 30)
-    condition = rnd.choice(["sunny", "cloudy", "rain", "windy"])
-    payload = {"city": city, "temperature": round(temperature, 1), "condition": condition}
+    temperature, condition = _compute_weather(city.lower())
+    payload = {"city": city, "temperature": temperature, "condition": condition}
     _finish_tool_log(log, payload, approved=True)
     return payload
 
 
-ASSISTANT_TOOLS = [read_email, search_web, analyze_data, weather_tool]
+ASSISTANT_TOOLS = (read_email, search_web, analyze_data, weather_tool)
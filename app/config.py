@@ -3,16 +3,24 @@
 import os
 from pathlib import Path
 
+import orjson
+
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # JSON columns are encoded/decoded with orjson instead of the stdlib json module.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "json_serializer": lambda obj: orjson.dumps(obj).decode(),
+        "json_deserializer": orjson.loads,
+    }
     SESSION_COOKIE_HTTPONLY = True
     LANGCHAIN_DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "openai:gpt-4o-mini")
     LANGCHAIN_PREMIUM_MODEL = os.environ.get("PREMIUM_MODEL", "openai:gpt-4o")
     GRAPH_DB_PATH = os.environ.get("GRAPH_DB_PATH", str(Path("graph_state.db")))
     POST_MIN_INTERVAL_SECONDS = float(os.environ.get("POST_MIN_INTERVAL", 2))
+    POST_BURST_SIZE = int(os.environ.get("POST_BURST_SIZE", 5))
     USE_FAKE_LLM = (
         os.environ.get(
             "USE_FAKE_LLM",
@@ -20,5 +28,7 @@ class Config:
         )
         == "1"
     )
+    CHAT_BACKGROUND_TURNS = os.environ.get("CHAT_BACKGROUND_TURNS", "0") == "1"
+    EAGER_AGENT_INIT = os.environ.get("EAGER_AGENT_INIT", "1") == "1"
     WTF_CSRF_TIME_LIMIT = None
     LANGCHAIN_TRACING_V2 = os.environ.get("LANGCHAIN_TRACING_V2", "false")
@@ -1,12 +1,14 @@
 ﻿from __future__ import annotations
 
-from datetime import datetime
-
 from flask_login import UserMixin
-from sqlalchemy import Index, func
+from sqlalchemy import Index, func, text
+from sqlalchemy.dialects.postgresql import JSONB
 
 from .extensions import db
 
+# JSONB on Postgres (indexable, binary); plain JSON text elsewhere.
+JSONType = db.JSON().with_variant(JSONB(), "postgresql")
+
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,7 +16,9 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     skill_level = db.Column(db.String(20), nullable=False, default="beginner")
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # default= renders now() into the INSERT itself, so tables created before the server
+    # default existed (db.create_all() never alters columns) still get a timestamp.
+    created_at = db.Column(db.DateTime, default=func.now(), server_default=func.now())
 
     messages = db.relationship("ChatMessage", backref="user", lazy=True)
 
@@ -30,12 +34,21 @@ class ChatMessage(db.Model):
     approved = db.Column(db.Boolean, nullable=True)
     rejection_reason = db.Column(db.Text, nullable=True)
     thread_id = db.Column(db.String(64), nullable=False, index=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    metadata_json = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=func.now(), server_default=func.now(), index=True)
+    metadata_json = db.Column(JSONType, nullable=True)
 
     __table_args__ = (
-        Index("ix_chatmessage_user", "user_id"),
-        Index("ix_chatmessage_thread_created", "thread_id", "created_at"),
+        Index("ix_chatmessage_user_thread_created", "user_id", "thread_id", "created_at"),
+        # At most one answer awaiting review per thread; target of the pending-row upsert.
+        Index(
+            "ix_chatmessage_pending_one",
+            "user_id",
+            "thread_id",
+            "role",
+            unique=True,
+            sqlite_where=text("approved IS NULL"),
+            postgresql_where=text("approved IS NULL"),
+        ),
     )
 
 
@@ -43,10 +56,12 @@ class ToolCallLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     tool_name = db.Column(db.String(50), nullable=False)
-    args_json = db.Column(db.Text, nullable=False)
-    result_json = db.Column(db.Text, nullable=True)
+    args_json = db.Column(JSONType, nullable=False)
+    result_json = db.Column(JSONType, nullable=True)
     approved = db.Column(db.Boolean, nullable=True)
     thread_id = db.Column(db.String(64), nullable=True, index=True)
-    created_at = db.Column(db.DateTime, server_default=func.now(), index=True)
+    created_at = db.Column(db.DateTime, default=func.now(), server_default=func.now(), index=True)
 
-    __table_args__ = (Index("ix_toolcall_user", "user_id"),)
+    __table_args__ = (
+        Index("ix_toolcall_user_thread_created", "user_id", "thread_id", "created_at"),
+    )
@@ -4,9 +4,14 @@ import os
 from pathlib import Path
 
 import pytest
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 from app import create_app
 from app.chat.agent_runtime import reset_chat_runtime
+from app.chat.history_cache import history_cache
+from app.chat.ratelimit import post_limiter
 from app.config import Config
 from app.extensions import db
 
@@ -19,12 +24,27 @@ class TestConfig(Config):
     GRAPH_DB_PATH = "test_graph_state.db"
 
 
-@pytest.fixture()
-def app():
+def _enable_sqlite_savepoints(engine) -> None:
+    """Let SQLAlchemy own BEGIN/SAVEPOINT; pysqlite's implicit transactions break them.
+
+    The in-memory database uses a StaticPool, so configuring its single DBAPI
+    connection once is enough.
+    """
+
+    with engine.connect() as connection:
+        connection.connection.dbapi_connection.isolation_level = None
+    event.listen(engine, "begin", lambda conn: conn.exec_driver_sql("BEGIN"))
+
+
+@pytest.fixture(scope="session")
+def application():
+    """One app and one schema for the whole run; tests are isolated by ``app`` below."""
+
     os.environ["USE_FAKE_LLM"] = "1"
     application = create_app(TestConfig)
     with application.app_context():
         db.create_all()
+        _enable_sqlite_savepoints(db.engine)
         yield application
         db.session.remove()
         db.drop_all()
@@ -34,6 +54,37 @@ def app():
         graph_file.unlink()
 
 
+@pytest.fixture()
+def app(application):
+    """Run each test inside an outer transaction that is rolled back afterwards.
+
+    Sessions join it through savepoints, so commits in app code stay invisible to
+    later tests and no DDL runs between tests. Flask-SQLAlchemy's ``Session.get_bind``
+    always returns the app engine, so a ``bind=`` session option is ignored and
+    ``db.session`` is swapped for a plain scoped session instead. This relies on
+    Flask-SQLAlchemy 3.1 internals; the version is pinned in the dev dependencies.
+    """
+
+    with application.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        original_session = db.session
+        db.session = scoped_session(
+            sessionmaker(bind=connection, join_transaction_mode="create_savepoint"),
+            # One session per app context, like Flask-SQLAlchemy's own scoping.
+            scopefunc=lambda: id(g._get_current_object()),
+        )
+        try:
+            yield application
+        finally:
+            db.session.remove()
+            db.session = original_session
+            transaction.rollback()
+            connection.close()
+    post_limiter.reset()
+    history_cache.clear()
+
+
 @pytest.fixture()
 def client(app):
     return app.test_client()
@@ -0,0 +1,22 @@
+from app import create_app
+from app.chat import agent_runtime
+from app.config import Config
+
+
+def test_create_app_without_llm_credentials(monkeypatch, tmp_path):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+    class OnlineConfig(Config):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+        USE_FAKE_LLM = False
+        EAGER_AGENT_INIT = True
+        GRAPH_DB_PATH = str(tmp_path / "graph_state.db")
+
+    agent_runtime.reset_chat_runtime()
+    try:
+        assert create_app(OnlineConfig) is not None
+        manager = agent_runtime._get_chat_manager()
+        assert manager._graph is not None
+        assert manager._agent is None
+    finally:
+        agent_runtime.reset_chat_runtime()
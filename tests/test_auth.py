@@ -1,11 +1,16 @@
-﻿from app.models import User
+﻿from werkzeug.security import generate_password_hash
 
+from app.extensions import db
+from app.models import User
 
-def register_user(client, email="tester@example.com", password="SecurePass123", skill="mid"):
+
+def register_user(
+    client, email="tester@example.com", password="SecurePass123", skill="mid", username="tester"
+):
     return client.post(
         "/auth/register",
         data={
-            "username": "tester",
+            "username": username,
             "email": email,
             "password": password,
             "confirm": password,
@@ -31,3 +36,35 @@ def test_registration_and_login_flow(client, app):
     )
     assert login_response.status_code == 200
     assert b"Python explainer chat" in login_response.data
+
+
+def test_legacy_pbkdf2_hash_is_upgraded_on_login(client, app):
+    with app.app_context():
+        db.session.add(
+            User(
+                username="legacy",
+                email="legacy@example.com",
+                password_hash=generate_password_hash("SecurePass123"),
+                skill_level="beginner",
+            )
+        )
+        db.session.commit()
+
+    response = client.post(
+        "/auth/login",
+        data={"email": "legacy@example.com", "password": "SecurePass123"},
+        follow_redirects=True,
+    )
+    assert b"Python explainer chat" in response.data
+    with app.app_context():
+        user = User.query.filter_by(email="legacy@example.com").first()
+        assert user.password_hash.startswith("$argon2id$")
+
+
+def test_registration_rejects_duplicate_email_case_insensitive(client, app):
+    register_user(client)
+    client.get("/auth/logout", follow_redirects=True)
+    register_user(client, email="Tester@Example.com", username="tester2")
+    with app.app_context():
+        assert User.query.count() == 1
+        assert User.query.filter_by(email="Tester@Example.com").first() is None
@@ -1,4 +1,18 @@
-﻿from app.models import ChatMessage
+﻿import threading
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+from sqlalchemy import text
+
+from app.chat import agent_runtime
+from app.chat import routes as chat_routes
+from app.chat.agent_runtime import build_langchain_history, run_chat_turn
+from app.chat.history_cache import history_cache
+from app.chat.queries import batch_fetch_thread_view, fetch_thread_history
+from app.chat.tasks import is_turn_running, release, try_claim
+from app.extensions import db
+from app.models import ChatMessage, ToolCallLog
 
 
 def _register_and_login(client):
@@ -20,7 +34,8 @@ def _register_and_login(client):
 def test_human_loop_roundtrip(client, app):
     _register_and_login(client)
 
-    client.post("/chat/", data={"message": "Erklaere Listen"}, follow_redirects=True)
+    response = client.post("/chat/", data={"message": "Erklaere Listen"}, follow_redirects=True)
+    assert b"Waiting for approval of the last answer." in response.data
     with app.app_context():
         assistant_msg = (
             ChatMessage.query.filter_by(role="assistant", approved=None)
@@ -56,3 +71,198 @@ def test_human_loop_roundtrip(client, app):
     with app.app_context():
         final_msg = ChatMessage.query.get(new_id)
         assert final_msg.approved is True
+
+
+def test_history_skips_unapproved_answers(client, app):
+    _register_and_login(client)
+    client.post("/chat/", data={"message": "Erklaere Listen"}, follow_redirects=True)
+
+    with app.app_context():
+        user_msg = ChatMessage.query.filter_by(role="user").first()
+        history = build_langchain_history(
+            fetch_thread_history(user_msg.user_id, user_msg.thread_id)
+        )
+        assert [type(msg) for msg in history] == [HumanMessage]
+        assert history[0].content == "Erklaere Listen"
+
+
+def test_background_turn_runs_on_pool_and_blocks_resume(client, app, monkeypatch):
+    _register_and_login(client)
+    monkeypatch.setitem(app.config, "CHAT_BACKGROUND_TURNS", True)
+    release = threading.Event()
+    workers = []
+    resumed = []
+
+    def blocking_turn(**kwargs):
+        workers.append(threading.current_thread().name)
+        release.wait(5)
+        return run_chat_turn(**kwargs)
+
+    monkeypatch.setattr(chat_routes, "run_chat_turn", blocking_turn)
+    monkeypatch.setattr(chat_routes, "resume_chat_turn", lambda **kwargs: resumed.append(kwargs))
+
+    client.post("/chat/", data={"message": "Erklaere Listen"})
+    with client.session_transaction() as sess:
+        thread_id = sess["thread_id"]
+    assert is_turn_running(thread_id)
+
+    response = client.post("/chat/approve", data={"message_id": 1}, follow_redirects=True)
+    assert b"The assistant is still working on this thread." in response.data
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while is_turn_running(thread_id) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert workers and workers[0].startswith("chat-turn")
+    assert resumed == []
+    response = client.get("/chat/")
+    assert b"Waiting for approval of the last answer." in response.data
+
+
+def test_post_refused_while_thread_is_claimed(client, app):
+    _register_and_login(client)
+    client.post("/chat/", data={"message": "Erklaere Listen"})
+    with app.app_context():
+        pending = ChatMessage.query.filter_by(role="assistant", approved=None).one()
+        pending_id, user_id, thread_id = pending.id, pending.user_id, pending.thread_id
+    client.post("/chat/approve", data={"message_id": pending_id})
+    cached = history_cache.get((user_id, thread_id))
+
+    # Another request owns the thread, e.g. a resume that was dispatched in between.
+    assert try_claim(thread_id)
+    try:
+        response = client.post("/chat/", data={"message": "Und Tupel?"}, follow_redirects=True)
+    finally:
+        release(thread_id)
+
+    assert b"The assistant is still working on this thread." in response.data
+    assert history_cache.get((user_id, thread_id)) == cached
+    with app.app_context():
+        assert ChatMessage.query.filter_by(content="Und Tupel?").first() is None
+
+
+def test_history_cache_appends_new_rows(client, app):
+    _register_and_login(client)
+    client.post("/chat/", data={"message": "Erklaere Listen"})
+    with app.app_context():
+        pending = ChatMessage.query.filter_by(role="assistant", approved=None).first()
+        pending_id, user_id, thread_id = pending.id, pending.user_id, pending.thread_id
+    client.post("/chat/approve", data={"message_id": pending_id})
+    client.post("/chat/", data={"message": "Und Tupel?"})
+
+    _, entries = history_cache.get((user_id, thread_id))
+    assert [role for role, _ in entries] == ["user", "assistant", "user"]
+    assert entries[-1] == ("user", "Und Tupel?")
+
+
+def test_history_cache_hit_matches_fresh_history(client, app, monkeypatch):
+    graph_inputs = []
+
+    def recording_turn(**kwargs):
+        graph_inputs.append([(type(msg), msg.content, msg.id) for msg in kwargs["history"]])
+        return run_chat_turn(**kwargs)
+
+    monkeypatch.setattr(chat_routes, "run_chat_turn", recording_turn)
+    _register_and_login(client)
+    client.post("/chat/", data={"message": "Erklaere Listen"})
+    with app.app_context():
+        pending = ChatMessage.query.filter_by(role="assistant", approved=None).one()
+        pending_id, user_id, thread_id = pending.id, pending.user_id, pending.thread_id
+    client.post("/chat/approve", data={"message_id": pending_id})
+    client.post("/chat/", data={"message": "Und Tupel?"})
+
+    with app.app_context():
+        fresh = build_langchain_history(fetch_thread_history(user_id, thread_id))
+    assert graph_inputs[-1] == [(type(msg), msg.content, msg.id) for msg in fresh]
+    assert all(msg_id is None for _, _, msg_id in graph_inputs[-1])
+
+
+def test_reset_deletes_thread_rows(client, app):
+    _register_and_login(client)
+    client.post("/chat/", data={"message": "Erklaere Listen"})
+    with app.app_context():
+        assert ChatMessage.query.count() == 2
+
+    client.post("/chat/reset")
+    with app.app_context():
+        assert ChatMessage.query.count() == 0
+
+
+def test_viewing_chat_does_not_create_thread(client):
+    _register_and_login(client)
+    client.get("/chat/")
+    with client.session_transaction() as sess:
+        assert "thread_id" not in sess
+
+    client.post("/chat/", data={"message": "Erklaere Listen"})
+    with client.session_transaction() as sess:
+        assert sess["thread_id"]
+
+
+def test_weather_question_logs_tool_call(client, app):
+    _register_and_login(client)
+    client.post("/chat/", data={"message": "What is the weather in Berlin"})
+
+    with app.app_context():
+        log = ToolCallLog.query.one()
+        assert log.tool_name == "weather_tool"
+        assert log.args_json == {"city": "Berlin"}
+        assert log.result_json["city"] == "Berlin"
+        assert log.approved is True
+
+
+def test_weather_demo_returns_structured_json(client):
+    _register_and_login(client)
+    response = client.get("/demo/weather?city=Berlin")
+
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"city": "Berlin", "temperature": 18.9, "condition": "windy"}
+
+
+@pytest.mark.parametrize("missing", ["dialect", "index"])
+def test_pending_row_without_upsert_support(client, app, monkeypatch, missing):
+    manager = agent_runtime._get_chat_manager()
+    monkeypatch.setattr(manager, "_pending_upsert", agent_runtime._UNRESOLVED)
+    if missing == "dialect":
+        monkeypatch.setattr(agent_runtime, "_UPSERT_INSERTS", {})
+    else:
+        # Tables created before the index existed; rolled back with the test transaction.
+        with app.app_context():
+            db.session.execute(text("DROP INDEX ix_chatmessage_pending_one"))
+            db.session.commit()
+    _register_and_login(client)
+    client.post("/chat/", data={"message": "Erklaere Listen"})
+    assert manager._pending_upsert is None
+    with app.app_context():
+        pending = ChatMessage.query.filter_by(role="assistant", approved=None).one()
+        pending_id = pending.id
+
+    client.post("/chat/reject", data={"message_id": pending_id, "feedback": "kuerzer"})
+    with app.app_context():
+        assert ChatMessage.query.get(pending_id).approved is False
+        regenerated = ChatMessage.query.filter_by(role="assistant", approved=None).one()
+        assert regenerated.id != pending_id
+
+
+def test_fresh_manager_can_build_agent_first(app):
+    manager = agent_runtime.ChatGraphManager()
+    with app.app_context():
+        assert manager._ensure_agent() is not None
+
+
+def test_follow_up_in_same_second_sorts_after_answer(client, app):
+    _register_and_login(client)
+    client.post("/chat/", data={"message": "Erklaere Listen"})
+    with app.app_context():
+        pending = ChatMessage.query.filter_by(role="assistant", approved=None).one()
+        pending_id, user_id, thread_id = pending.id, pending.user_id, pending.thread_id
+    client.post("/chat/approve", data={"message_id": pending_id})
+    client.post("/chat/", data={"message": "Und Tupel?"})
+
+    with app.app_context():
+        history = fetch_thread_history(user_id, thread_id)
+        assert [row.role for row in history] == ["user", "assistant", "user"]
+        assert history[-1].content == "Und Tupel?"
+        messages, _, _ = batch_fetch_thread_view(user_id, thread_id)
+        assert [row.role for row in messages] == ["user", "assistant", "user", "assistant"]
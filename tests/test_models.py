@@ -0,0 +1,22 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.models import ChatMessage
+
+
+def test_created_at_is_set_without_server_default():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        # Column layout of an app.db created before created_at had a server default.
+        connection.exec_driver_sql(
+            "CREATE TABLE chat_message (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL,"
+            " role VARCHAR(20) NOT NULL, content TEXT NOT NULL, approved BOOLEAN,"
+            " rejection_reason TEXT, thread_id VARCHAR(64) NOT NULL, created_at DATETIME,"
+            " metadata_json JSON)"
+        )
+
+    with Session(engine) as session:
+        message = ChatMessage(user_id=1, role="user", content="Hallo", thread_id="t1")
+        session.add(message)
+        session.commit()
+        assert message.created_at is not None
@@ -0,0 +1,18 @@
+from app.chat import ratelimit
+from app.chat.ratelimit import TokenBucketLimiter
+
+
+def test_bucket_allows_burst_then_blocks():
+    limiter = TokenBucketLimiter()
+    results = [limiter.consume(1, capacity=3, refill_rate=0.001) for _ in range(4)]
+    assert results == [True, True, True, False]
+    assert limiter.consume(2, capacity=3, refill_rate=0.001)
+
+
+def test_bucket_refills_over_time(monkeypatch):
+    clock = iter([100.0, 100.0, 102.5])
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: next(clock))
+    limiter = TokenBucketLimiter()
+    assert limiter.consume("user", capacity=1, refill_rate=0.5)
+    assert not limiter.consume("user", capacity=1, refill_rate=0.5)
+    assert limiter.consume("user", capacity=1, refill_rate=0.5)